@@ -1,12 +1,15 @@
 import boto3
 import logging
 
+from claim_check import offload_large_fields
+
 # Initialize AWS clients
 sm = boto3.client("sagemaker")
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+@offload_large_fields
 def handler(event, context):
     # Extract AutoML job name from the event
     auto_ml_job_name = event.get("auto_ml_job_name")
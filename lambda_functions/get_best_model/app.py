@@ -3,6 +3,8 @@ import boto3
 import os
 import logging
 
+from claim_check import offload_large_fields
+
 # Setup logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -14,6 +16,7 @@ sm = boto3.client("sagemaker")
 sm_role = os.environ["SM_ROLE"]
 
 
+@offload_large_fields
 def handler(event, context):
     try:
         threshold = event.get("threshold")
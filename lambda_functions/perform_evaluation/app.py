@@ -1,10 +1,15 @@
 import json
 import boto3
+import hashlib
 import logging
-from io import StringIO
+import os
+from collections import OrderedDict
 from datetime import datetime
 from math import sqrt
 
+from claim_check import offload_large_fields
+from compression import detect_compression, open_text
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
@@ -12,15 +17,32 @@ logger = logging.getLogger()
 # Initialize AWS clients
 s3 = boto3.client("s3")
 
+# Evaluation results are cached in S3, and in memory while the container is warm
+cache_prefix = os.environ.get("EVALUATION_CACHE_PREFIX", "cache/evaluation")
+cache_max_entries = int(os.environ.get("EVALUATION_CACHE_MAX_ENTRIES", 32))
+memory_cache = OrderedDict()
+
+# Part of the cache key, bump it when a change to evaluate or calculate_rmse
+# changes the results, so the ones cached by the previous version are not reused
+EVALUATOR_VERSION = 1
+
+# Inputs overwritten while they are read are evaluated again, up to this many times
+max_attempts = max(1, int(os.environ.get("EVALUATION_MAX_ATTEMPTS", 3)))
+
 
 # Helper function to parse CSV from S3 into a list of dictionaries
-def load_csv_from_s3(bucket, key):
+# gzip and zstd objects are decompressed while streaming the body
+def load_csv_from_s3(bucket, key, etag=None):
     try:
-        response = s3.get_object(Bucket=bucket, Key=key)
-        content = StringIO(response["Body"].read().decode("utf-8"))
-        lines = content.readlines()
-        headers = lines[0].strip().split(",")
-        data = [dict(zip(headers, line.strip().split(","))) for line in lines[1:]]
+        kwargs = {"Bucket": bucket, "Key": key}
+        # IfMatch makes sure the data is the version the cache key was built from
+        if etag:
+            kwargs["IfMatch"] = etag
+        response = s3.get_object(**kwargs)
+        compression = detect_compression(key, response.get("ContentEncoding"))
+        with open_text(response["Body"], compression) as content:
+            headers = next(content).strip().split(",")
+            data = [dict(zip(headers, line.strip().split(","))) for line in content]
         for item in data:
             item["timestamp"] = datetime.strptime(
                 item["timestamp"], "%Y-%m-%d %H:%M:%S"
@@ -48,6 +70,110 @@ def calculate_rmse(actuals, predictions):
         raise
 
 
+# Cache key of an evaluation, built from the ETags of the input objects
+def get_cache_key(hist_etag, pred_etag, date, metric):
+    key = json.dumps([EVALUATOR_VERSION, hist_etag, pred_etag, date, metric])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+# Keep the most recently used evaluations in memory, evicting the oldest ones
+def remember_evaluation(cache_key, evaluation):
+    memory_cache[cache_key] = evaluation
+    memory_cache.move_to_end(cache_key)
+    while len(memory_cache) > cache_max_entries:
+        memory_cache.popitem(last=False)
+
+
+def get_cached_evaluation(bucket, cache_key):
+    if cache_key in memory_cache:
+        memory_cache.move_to_end(cache_key)
+        return memory_cache[cache_key]
+    try:
+        response = s3.get_object(Bucket=bucket, Key=f"{cache_prefix}/{cache_key}.json")
+    except s3.exceptions.NoSuchKey:
+        return None
+    evaluation = json.load(response["Body"])
+    remember_evaluation(cache_key, evaluation)
+    return evaluation
+
+
+def put_cached_evaluation(bucket, cache_key, evaluation):
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{cache_prefix}/{cache_key}.json",
+        Body=json.dumps(evaluation),
+        ContentType="application/json",
+    )
+    remember_evaluation(cache_key, evaluation)
+
+
+# Calculate the metric of the predictions on the target date
+# Returns None if the metric is not supported
+def evaluate(
+    bucket_name, hist_key, hist_etag, pred_key, pred_etag, target_date, metric
+):
+    # Load data
+    hist_data = load_csv_from_s3(bucket_name, hist_key, hist_etag)
+    pred_data = load_csv_from_s3(bucket_name, pred_key, pred_etag)
+
+    # Filter data by target date
+    filtered_hist = [row for row in hist_data if row["timestamp"].date() == target_date]
+    filtered_pred = [row for row in pred_data if row["timestamp"].date() == target_date]
+
+    # Match records by 'id' and 'timestamp'
+    merged_data = {}
+    for h in filtered_hist:
+        for p in filtered_pred:
+            if h["id"] == p["id"] and h["timestamp"] == p["timestamp"]:
+                if h["id"] in merged_data:
+                    merged_data[h["id"]].append((h["actual_power"], p["p50"]))
+                else:
+                    merged_data[h["id"]] = [(h["actual_power"], p["p50"])]
+
+    # Calculate RMSE per ID
+    results = {}
+    total_rmse = 0
+    count_ids = 0
+    if metric == "RMSE":  # Replace this code block if you want to use other metrics
+        for id, pairs in merged_data.items():
+            actuals, predictions = zip(*pairs)
+            rmse = calculate_rmse(actuals, predictions)
+            results[id] = rmse
+            total_rmse += rmse
+            count_ids += 1
+
+        average_rmse = total_rmse / count_ids if count_ids > 0 else 0
+    else:
+        return None
+
+    return {"average_rmse": average_rmse, "rmse_by_id": results}
+
+
+def is_precondition_failed(error):
+    return error.response.get("Error", {}).get("Code") == "PreconditionFailed"
+
+
+# Evaluate the current versions of the inputs, reusing a cached result if any
+# Returns the cache key, which identifies the versions evaluated, with the result
+# Raises PreconditionFailed if an input is overwritten after its ETag was read
+def get_evaluation(bucket_name, hist_key, pred_key, date, target_date, metric):
+    hist_etag = s3.head_object(Bucket=bucket_name, Key=hist_key)["ETag"]
+    pred_etag = s3.head_object(Bucket=bucket_name, Key=pred_key)["ETag"]
+    cache_key = get_cache_key(hist_etag, pred_etag, date, metric)
+    evaluation = get_cached_evaluation(bucket_name, cache_key)
+
+    if evaluation is None:
+        evaluation = evaluate(
+            bucket_name, hist_key, hist_etag, pred_key, pred_etag, target_date, metric
+        )
+        if evaluation is not None:
+            put_cached_evaluation(bucket_name, cache_key, evaluation)
+    else:
+        logger.info(f"Reusing cached evaluation {cache_key} for {date}.")
+    return cache_key, evaluation
+
+
+@offload_large_fields
 def handler(event, context):
     try:
         # Parameters from the event
@@ -59,48 +185,26 @@ def handler(event, context):
         date = event.get("date")
         target_date = datetime.strptime(date, "%Y-%m-%d").date()
 
-        # Load data
-        hist_data = load_csv_from_s3(bucket_name, hist_key)
-        pred_data = load_csv_from_s3(bucket_name, pred_key)
-
-        # Filter data by target date
-        filtered_hist = [
-            row for row in hist_data if row["timestamp"].date() == target_date
-        ]
-        filtered_pred = [
-            row for row in pred_data if row["timestamp"].date() == target_date
-        ]
-
-        # Match records by 'id' and 'timestamp'
-        merged_data = {}
-        for h in filtered_hist:
-            for p in filtered_pred:
-                if h["id"] == p["id"] and h["timestamp"] == p["timestamp"]:
-                    if h["id"] in merged_data:
-                        merged_data[h["id"]].append((h["actual_power"], p["p50"]))
-                    else:
-                        merged_data[h["id"]] = [(h["actual_power"], p["p50"])]
-
-        # Calculate RMSE per ID
-        results = {}
-        total_rmse = 0
-        count_ids = 0
-        if metric == "RMSE": # Replace this code block if you want to use other metrics
-            for id, pairs in merged_data.items():
-                actuals, predictions = zip(*pairs)
-                rmse = calculate_rmse(actuals, predictions)
-                results[id] = rmse
-                total_rmse += rmse
-                count_ids += 1
-
-            average_rmse = total_rmse / count_ids if count_ids > 0 else 0
-            result_text = f"Average RMSE for all IDs: {average_rmse}"
-        else:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                cache_key, evaluation = get_evaluation(
+                    bucket_name, hist_key, pred_key, date, target_date, metric
+                )
+                break
+            except s3.exceptions.ClientError as e:
+                if not is_precondition_failed(e) or attempt == max_attempts:
+                    raise
+                logger.warning(f"Inputs changed while being read, retrying: {e}")
+
+        if evaluation is None:
             return {
                 "statusCode": 400,
                 "body": 'Invalid metric specified. Please use "RMSE".',
             }
 
+        average_rmse = evaluation["average_rmse"]
+        results = evaluation["rmse_by_id"]
+
         # # Select your DynamoDB table
         # table = dynamodb.Table('model-daily-performance')
 
@@ -116,7 +220,9 @@ def handler(event, context):
 
         # Update event with calculated values
         event["average_rmse"] = average_rmse
+        event["rmse_by_id"] = results
         event["eval_result"] = eval_result
+        event["evaluation_key"] = cache_key
 
         # Return the result
         return event
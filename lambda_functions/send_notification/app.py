@@ -3,6 +3,8 @@ import boto3
 import os
 import logging
 
+from claim_check import offload_large_fields
+
 # Setup logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -15,6 +17,7 @@ sns = boto3.client("sns")
 sns_topic_arn = os.environ["SNS_TOPIC_ARN"]
 
 
+@offload_large_fields
 def handler(event, context):
     try:
         # Extract relevant information from the event
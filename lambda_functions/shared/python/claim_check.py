@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from functools import wraps
+
+import boto3
+
+# Setup logging
+logger = logging.getLogger()
+
+# Initialize AWS clients
+s3 = boto3.client("s3")
+
+# Fields whose JSON encoding is larger than this are moved to S3
+threshold_bytes = int(os.environ.get("CLAIM_CHECK_THRESHOLD_BYTES", 8 * 1024))
+key_prefix = os.environ.get("CLAIM_CHECK_PREFIX", "claim-check")
+
+# Marker of a field that has been replaced by a reference to S3
+REFERENCE_KEY = "claim_check"
+
+
+def is_reference(value):
+    return isinstance(value, dict) and list(value) == [REFERENCE_KEY]
+
+
+def encode(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+# Store a field as gzip compressed JSON and return the reference to it
+def put_field(bucket, value):
+    body = gzip.compress(encode(value).encode("utf-8"), mtime=0)
+    # Content addressed key, so retried states don't create new objects
+    key = f"{key_prefix}/{hashlib.sha256(body).hexdigest()}.json.gz"
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentType="application/json",
+        ContentEncoding="gzip",
+    )
+    return {REFERENCE_KEY: {"bucket": bucket, "key": key}}
+
+
+# Fetch a field back from the reference created by put_field
+def get_field(reference):
+    location = reference[REFERENCE_KEY]
+    response = s3.get_object(Bucket=location["bucket"], Key=location["key"])
+    with gzip.GzipFile(fileobj=response["Body"]) as body:
+        return json.load(body)
+
+
+class LazyEvent(dict):
+    """State input whose offloaded fields are fetched from S3 on first access."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Reference and encoding of every field fetched from S3
+        self.fetched = {}
+
+    def __getitem__(self, field):
+        value = super().__getitem__(field)
+        if is_reference(value):
+            reference = value
+            value = get_field(reference)
+            self.fetched[field] = (reference, encode(value))
+            super().__setitem__(field, value)
+        return value
+
+    def get(self, field, default=None):
+        return self[field] if field in self else default
+
+
+# Replace large fields of the state output with references to S3
+def offload(event):
+    bucket = os.environ.get("CLAIM_CHECK_BUCKET") or dict.get(event, "bucket_name")
+    if not bucket:
+        return dict(event)
+
+    fetched = getattr(event, "fetched", {})
+    output = {}
+    # dict.items() returns the raw values, so untouched references pass through
+    for field, value in dict.items(event):
+        if not is_reference(value):
+            encoded = encode(value)
+            reference, fetched_encoded = fetched.get(field, (None, None))
+            if encoded == fetched_encoded:
+                # Read but unchanged, the object in S3 is still valid
+                value = reference
+            elif len(encoded) > threshold_bytes:
+                value = put_field(bucket, value)
+                logger.info(f"Offloaded field {field} ({len(encoded)} bytes) to S3.")
+        output[field] = value
+    return output
+
+
+# Decorator for state handlers: lazy input fields and offloaded output fields
+def offload_large_fields(handler):
+    @wraps(handler)
+    def wrapper(event, context):
+        result = handler(LazyEvent(event), context)
+        if isinstance(result, dict):
+            return offload(result)
+        return result
+
+    return wrapper
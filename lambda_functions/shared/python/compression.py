@@ -0,0 +1,42 @@
+import gzip
+import io
+
+try:
+    import zstandard
+except ImportError:  # zstd inputs fail with a clear error instead of on import
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# Compression detected from the Content-Encoding of the object or its key suffix
+CONTENT_ENCODINGS = {"gzip": GZIP, "x-gzip": GZIP, "zstd": ZSTD}
+KEY_SUFFIXES = {".gz": GZIP, ".gzip": GZIP, ".zst": ZSTD, ".zstd": ZSTD}
+
+
+def detect_compression(key, content_encoding=None):
+    if content_encoding:
+        compression = CONTENT_ENCODINGS.get(content_encoding.strip().lower())
+        if compression:
+            return compression
+    for suffix, compression in KEY_SUFFIXES.items():
+        if key.lower().endswith(suffix):
+            return compression
+    return None
+
+
+# Wrap an S3 object body so that it is decompressed while it is read
+def open_binary(body, compression):
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=body, mode="rb")
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard package is required to read zstd objects.")
+        return zstandard.ZstdDecompressor().stream_reader(
+            body, read_across_frames=True
+        )
+    return body
+
+
+def open_text(body, compression, encoding="utf-8"):
+    return io.TextIOWrapper(open_binary(body, compression), encoding=encoding)
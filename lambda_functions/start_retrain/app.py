@@ -2,25 +2,63 @@ import json
 import boto3
 import os
 import logging
+import gzip
+import shutil
+import tempfile
 from time import gmtime, strftime
 
+from claim_check import offload_large_fields
+from compression import GZIP, ZSTD, detect_compression, open_binary
+
 # Setup logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # Initialize AWS clients
 sm = boto3.client("sagemaker")
+s3 = boto3.client("s3")
 
 # Get environment variable
 sm_role = os.environ["SM_ROLE"]
 
 
+# Resolve the Autopilot training input and its compression type
+# gzip objects are passed through, zstd objects are recompressed to gzip
+def get_training_input(bucket_name, hist_key, hist_path):
+    head = s3.head_object(Bucket=bucket_name, Key=hist_key)
+    compression = detect_compression(hist_key, head.get("ContentEncoding"))
+
+    if compression == GZIP:
+        return hist_path, "Gzip"
+    if compression != ZSTD:
+        return hist_path, "None"
+
+    # Autopilot only reads gzip, recompress through a temporary file on /tmp
+    file_name, suffix = os.path.splitext(os.path.basename(hist_key))
+    if suffix.lower() not in (".zst", ".zstd"):
+        file_name += suffix
+    training_key = f"autopilot/train_input/{os.path.dirname(hist_key)}/{file_name}.gz"
+    response = s3.get_object(Bucket=bucket_name, Key=hist_key)
+    with tempfile.TemporaryFile() as training_file:
+        with open_binary(response["Body"], ZSTD) as source, gzip.GzipFile(
+            fileobj=training_file, mode="wb"
+        ) as target:
+            shutil.copyfileobj(source, target)
+        training_file.seek(0)
+        s3.upload_fileobj(training_file, bucket_name, training_key)
+
+    logger.info(f"Recompressed {hist_key} to {training_key} for Autopilot.")
+    return f"s3://{bucket_name}/{training_key}", "Gzip"
+
+
+@offload_large_fields
 def handler(event, context):
     try:
 
         # Extract relevant information from the event
         bucket_name = event.get("bucket_name")
         metric = event.get("metric")
+        hist_key = event.get("hist_key")
         hist_path = event.get("hist_path")
         autopilot_job_max_number = event.get("autopilot_job_max_number")
         autopilot_output_path = event.get("autopilot_output_path")
@@ -30,15 +68,18 @@ def handler(event, context):
         auto_ml_job_name = "ts-" + timestamp_suffix
 
         # Define input data configuration
+        training_path, compression_type = get_training_input(
+            bucket_name, hist_key, hist_path
+        )
         input_data_config = [
             {
                 "ChannelType": "training",
                 "ContentType": "text/csv;header=present",
-                "CompressionType": "None",
+                "CompressionType": compression_type,
                 "DataSource": {
                     "S3DataSource": {
                         "S3DataType": "S3Prefix",
-                        "S3Uri": hist_path,
+                        "S3Uri": training_path,
                     }
                 },
             }
@@ -0,0 +1,898 @@
+"""Run the state machines of ResourceStack locally.
+
+The runner walks the synthesized Amazon States Language definitions and invokes
+the real ``lambda_functions/*/app.py`` handlers against in-process stand-ins for
+S3, SSM, SageMaker, SNS and Step Functions. Wait states advance a virtual clock,
+so a scenario that polls Autopilot for hours runs in seconds. Each scenario
+reports its critical path, the latency of every state and the AWS API calls made.
+
+    $ python -m sagemaker_autopilot_time_series_monitoring_retraining.local_runner
+"""
+
+import argparse
+import collections
+import contextlib
+import copy
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import operator
+import os
+import sys
+import time
+import types
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+LAMBDA_FUNCTIONS_DIR = PROJECT_DIR / "lambda_functions"
+SHARED_DIR = LAMBDA_FUNCTIONS_DIR / "shared" / "python"
+SHARED_MODULES = ("claim_check", "compression")
+
+# Values of the pseudo parameters referenced by the template
+PSEUDO_PARAMETERS = {
+    "AWS::AccountId": "123456789012",
+    "AWS::Partition": "aws",
+    "AWS::Region": "us-east-1",
+    "AWS::URLSuffix": "amazonaws.com",
+}
+
+LAMBDA_INVOKE = ":states:::lambda:invoke"
+START_EXECUTION = ":states:::states:startExecution"
+
+
+@lru_cache(maxsize=1)
+def synthesize_template(email="data-scientist@example.com"):
+    import aws_cdk as core
+
+    from sagemaker_autopilot_time_series_monitoring_retraining.resource_stack import (
+        ResourceStack,
+    )
+
+    # Asset paths of the stack are relative to the project directory
+    cwd = os.getcwd()
+    os.chdir(PROJECT_DIR)
+    try:
+        app = core.App(
+            context={
+                "email": email,
+                "aws:cdk:bundling-stacks": [],
+                "aws:cdk:enable-path-metadata": True,
+            }
+        )
+        ResourceStack(app, "ResourceStack")
+        return app.synth().get_stack_by_name("ResourceStack").template
+    finally:
+        os.chdir(cwd)
+
+
+# Resolve the intrinsic functions of the template into local identifiers
+def resolve(value):
+    if isinstance(value, str):
+        return value
+    if "Ref" in value:
+        return PSEUDO_PARAMETERS.get(value["Ref"], f"local:{value['Ref']}")
+    if "Fn::GetAtt" in value:
+        return f"local:{value['Fn::GetAtt'][0]}"
+    if "Fn::Join" in value:
+        separator, parts = value["Fn::Join"]
+        return separator.join(resolve(part) for part in parts)
+    raise ValueError(f"Unsupported intrinsic function: {value}")
+
+
+# Minimal JSONPath support, enough for the paths generated by the CDK
+def get_path(data, path, context=None):
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    if path == "$":
+        return data
+    for part in path[2:].split("."):
+        data = data[part]
+    return data
+
+
+def set_path(data, path, value):
+    if path == "$":
+        return value
+    data = copy.deepcopy(data)
+    node = data
+    parts = path[2:].split(".")
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+    node[parts[-1]] = value
+    return data
+
+
+# Split the arguments of an intrinsic function on the top level commas
+def split_arguments(arguments):
+    parts, current, depth, quoted = [], "", 0, False
+    for index, char in enumerate(arguments):
+        if char == "'" and arguments[index - 1 : index] != "\\":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    return parts + [current]
+
+
+# Intrinsic functions used by the CDK generated definitions
+def evaluate_intrinsic(expression, data, context):
+    expression = expression.strip()
+    if expression.startswith("'"):
+        return expression[1:-1].replace("\\'", "'")
+    if expression.startswith("$"):
+        return get_path(data, expression, context)
+
+    name, arguments = expression[:-1].split("(", 1)
+    arguments = [
+        evaluate_intrinsic(argument, data, context)
+        for argument in split_arguments(arguments)
+    ]
+    if name == "States.Format":
+        template, *values = arguments
+        for value in values:
+            template = template.replace("{}", str(value), 1)
+        return template
+    if name == "States.Hash":
+        value, algorithm = arguments
+        algorithm = algorithm.replace("-", "").lower()
+        return hashlib.new(algorithm, value.encode("utf-8")).hexdigest()
+    raise NotImplementedError(f"Unsupported intrinsic function: {name}")
+
+
+def render_parameters(parameters, data, context):
+    rendered = {}
+    for key, value in parameters.items():
+        if key.endswith(".$") and value.startswith("States."):
+            rendered[key[:-2]] = evaluate_intrinsic(value, data, context)
+        elif key.endswith(".$"):
+            rendered[key[:-2]] = get_path(data, value, context)
+        elif isinstance(value, dict):
+            rendered[key] = render_parameters(value, data, context)
+        else:
+            rendered[key] = value
+    return rendered
+
+
+COMPARISONS = {
+    "StringEquals": operator.eq,
+    "NumericEquals": operator.eq,
+    "NumericLessThan": operator.lt,
+    "NumericLessThanEquals": operator.le,
+    "NumericGreaterThan": operator.gt,
+    "NumericGreaterThanEquals": operator.ge,
+    "BooleanEquals": operator.eq,
+}
+
+
+def matches(rule, data):
+    if "And" in rule:
+        return all(matches(child, data) for child in rule["And"])
+    if "Or" in rule:
+        return any(matches(child, data) for child in rule["Or"])
+    if "Not" in rule:
+        return not matches(rule["Not"], data)
+    if "IsPresent" in rule:
+        try:
+            get_path(data, rule["Variable"])
+            present = True
+        except (KeyError, TypeError):
+            present = False
+        return present == rule["IsPresent"]
+    for name, compare in COMPARISONS.items():
+        if name in rule:
+            return compare(get_path(data, rule["Variable"]), rule[name])
+        if name + "Path" in rule:
+            return compare(
+                get_path(data, rule["Variable"]), get_path(data, rule[name + "Path"])
+            )
+    raise NotImplementedError(f"Unsupported choice rule: {rule}")
+
+
+class LocalClientError(Exception):
+    """Error raised by the stand-ins, shaped like botocore's ClientError."""
+
+    def __init__(self, code, message, operation_name):
+        super().__init__(f"An error occurred ({code}) when calling {operation_name}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+        self.operation_name = operation_name
+
+
+class NoSuchKey(LocalClientError):
+    pass
+
+
+class LocalAws:
+    """In-process state of the AWS services used by the Lambda functions."""
+
+    def __init__(self, parameters=None, automl_polls=2, best_candidate_metric=30.0):
+        self.objects = {}
+        self.parameters = dict(parameters or {})
+        self.automl_jobs = {}
+        self.automl_polls = automl_polls
+        self.best_candidate_metric = best_candidate_metric
+        self.messages = []
+        self.started_executions = []
+        # (state machine ARN, name) of the named executions
+        self.execution_names = set()
+        self.calls = collections.Counter()
+
+    # Replacement of boto3.client
+    def client(self, service_name, *args, **kwargs):
+        clients = {
+            "s3": LocalS3,
+            "ssm": LocalSsm,
+            "sagemaker": LocalSageMaker,
+            "sns": LocalSns,
+            "stepfunctions": LocalStepFunctions,
+        }
+        return clients[service_name](self)
+
+    def put_object(self, bucket, key, body, content_encoding=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.objects[(bucket, key)] = {
+            "Body": body,
+            "ETag": f'"{hashlib.md5(body).hexdigest()}"',
+            "ContentEncoding": content_encoding,
+        }
+
+
+class LocalClient:
+    service = None
+    exceptions = types.SimpleNamespace(
+        ClientError=LocalClientError, NoSuchKey=NoSuchKey
+    )
+
+    def __init__(self, aws):
+        self.aws = aws
+
+    def record(self, operation):
+        self.aws.calls[f"{self.service}:{operation}"] += 1
+
+
+class LocalS3(LocalClient):
+    service = "s3"
+
+    def get_object(self, Bucket, Key, IfMatch=None, **kwargs):
+        self.record("GetObject")
+        stored = self.aws.objects.get((Bucket, Key))
+        if stored is None:
+            raise NoSuchKey(
+                "NoSuchKey", "The specified key does not exist.", "GetObject"
+            )
+        if IfMatch is not None and IfMatch != stored["ETag"]:
+            raise LocalClientError(
+                "PreconditionFailed",
+                "At least one of the pre-conditions you specified did not hold",
+                "GetObject",
+            )
+        return self.describe(stored, Body=io.BytesIO(stored["Body"]))
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.record("HeadObject")
+        stored = self.aws.objects.get((Bucket, Key))
+        if stored is None:
+            raise LocalClientError("404", "Not Found", "HeadObject")
+        return self.describe(stored)
+
+    def put_object(self, Bucket, Key, Body, ContentEncoding=None, **kwargs):
+        self.record("PutObject")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        self.aws.put_object(Bucket, Key, Body, content_encoding=ContentEncoding)
+        return {"ETag": self.aws.objects[(Bucket, Key)]["ETag"]}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        self.put_object(Bucket, Key, Fileobj, **(ExtraArgs or {}))
+
+    @staticmethod
+    def describe(stored, **response):
+        response["ETag"] = stored["ETag"]
+        response["ContentLength"] = len(stored["Body"])
+        if stored["ContentEncoding"]:
+            response["ContentEncoding"] = stored["ContentEncoding"]
+        return response
+
+
+class LocalSsm(LocalClient):
+    service = "ssm"
+
+    def get_parameter(self, Name, **kwargs):
+        self.record("GetParameter")
+        if Name not in self.aws.parameters:
+            raise LocalClientError("ParameterNotFound", Name, "GetParameter")
+        return {"Parameter": {"Name": Name, "Value": self.aws.parameters[Name]}}
+
+
+class LocalSageMaker(LocalClient):
+    service = "sagemaker"
+
+    def create_auto_ml_job_v2(self, AutoMLJobName, **kwargs):
+        self.record("CreateAutoMLJobV2")
+        self.aws.automl_jobs[AutoMLJobName] = {
+            "request": kwargs,
+            "polls_left": self.aws.automl_polls,
+        }
+        return {"AutoMLJobArn": f"local:automl-job/{AutoMLJobName}"}
+
+    # The job reports InProgress for automl_polls calls, then Completed
+    def describe_auto_ml_job_v2(self, AutoMLJobName, **kwargs):
+        self.record("DescribeAutoMLJobV2")
+        job = self.aws.automl_jobs[AutoMLJobName]
+        if job["polls_left"] > 0:
+            job["polls_left"] -= 1
+            return {"AutoMLJobName": AutoMLJobName, "AutoMLJobStatus": "InProgress"}
+        return {
+            "AutoMLJobName": AutoMLJobName,
+            "AutoMLJobStatus": "Completed",
+            "BestCandidate": {
+                "CandidateName": f"{AutoMLJobName}-best",
+                "InferenceContainers": [{"Image": "local", "ModelDataUrl": "local"}],
+                "FinalAutoMLJobObjectiveMetric": {
+                    "MetricName": "RMSE",
+                    "Value": self.aws.best_candidate_metric,
+                },
+            },
+        }
+
+    def create_model(self, ModelName, **kwargs):
+        self.record("CreateModel")
+        return {"ModelArn": f"local:model/{ModelName}"}
+
+
+class LocalSns(LocalClient):
+    service = "sns"
+
+    def publish(self, TopicArn, Message, Subject=None, **kwargs):
+        self.record("Publish")
+        self.aws.messages.append({"Subject": Subject, "Message": Message})
+        return {"MessageId": str(len(self.aws.messages))}
+
+
+class LocalStepFunctions(LocalClient):
+    service = "states"
+
+    # Executions are queued and run by the LocalRunner once the caller returns
+    def start_execution(self, stateMachineArn, input="{}", **kwargs):
+        self.record("StartExecution")
+        self.aws.started_executions.append((stateMachineArn, json.loads(input)))
+        return {"executionArn": f"{stateMachineArn}:execution"}
+
+
+@contextlib.contextmanager
+def patched_environ(variables):
+    saved = dict(os.environ)
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+class LocalFunction:
+    def __init__(self, name, handler, environment):
+        self.name = name
+        self.handler = handler
+        self.environment = environment
+
+    def invoke(self, event):
+        with patched_environ(self.environment):
+            return self.handler(event, None)
+
+
+# Import the handler of every Lambda function of the template with boto3 replaced
+def load_functions(template, aws):
+    fake_boto3 = types.ModuleType("boto3")
+    fake_boto3.client = aws.client
+
+    saved = {name: sys.modules.get(name) for name in ("boto3", *SHARED_MODULES)}
+    sys.modules["boto3"] = fake_boto3
+    for name in SHARED_MODULES:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, str(SHARED_DIR))
+
+    functions = {}
+    try:
+        for logical_id, resource in template["Resources"].items():
+            if resource["Type"] != "AWS::Lambda::Function":
+                continue
+            # aws:cdk:path is ResourceStack/<construct id>/Resource
+            path = resource.get("Metadata", {}).get("aws:cdk:path", "").split("/")
+            if len(path) < 3:
+                continue
+            name = path[-2]
+            module_name, handler_name = resource["Properties"]["Handler"].split(".")
+            source = LAMBDA_FUNCTIONS_DIR / name / f"{module_name}.py"
+            if not source.exists():
+                continue
+
+            variables = (
+                resource["Properties"].get("Environment", {}).get("Variables", {})
+            )
+            environment = {key: resolve(value) for key, value in variables.items()}
+            spec = importlib.util.spec_from_file_location(f"{name}_app", source)
+            module = importlib.util.module_from_spec(spec)
+            with patched_environ(environment):
+                spec.loader.exec_module(module)
+
+            functions[f"local:{logical_id}"] = LocalFunction(
+                name, getattr(module, handler_name), environment
+            )
+    finally:
+        sys.path.remove(str(SHARED_DIR))
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+    return functions
+
+
+class StateFailed(Exception):
+    def __init__(self, error, cause):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+class StateVisit:
+    def __init__(self, name, state_type, start, latency, api_calls, payload_bytes):
+        self.name = name
+        self.state_type = state_type
+        self.start = start
+        self.latency = latency
+        self.api_calls = api_calls
+        self.payload_bytes = payload_bytes
+
+
+class Execution:
+    def __init__(self, name, state_machine_type, start, parent=None):
+        self.name = name
+        self.state_machine_type = state_machine_type
+        self.start = start
+        self.end = start
+        # (execution, index of the visit) that started this execution
+        self.parent = parent
+        self.visits = []
+        self.status = "RUNNING"
+        self.output = None
+        self.error = None
+
+
+class ScenarioResult:
+    def __init__(self, name, executions, aws, api_calls, messages):
+        self.name = name
+        self.executions = executions
+        self.aws = aws
+        self.api_calls = api_calls
+        self.messages = messages
+
+    @property
+    def status(self):
+        failed = [e for e in self.executions if e.status == "FAILED"]
+        return "FAILED" if failed else "SUCCEEDED"
+
+    @property
+    def duration(self):
+        return max(e.end for e in self.executions) - self.executions[0].start
+
+    # Chain of state visits that ends with the last execution to finish
+    def critical_path(self):
+        execution = max(self.executions, key=lambda e: e.end)
+        path = list((execution, visit) for visit in execution.visits)
+        while execution.parent:
+            execution, index = execution.parent
+            path[:0] = [(execution, visit) for visit in execution.visits[: index + 1]]
+        return path
+
+    def state_latencies(self):
+        latencies = collections.OrderedDict()
+        for execution in self.executions:
+            for visit in execution.visits:
+                count, total = latencies.get((execution.name, visit.name), (0, 0.0))
+                latencies[(execution.name, visit.name)] = (
+                    count + 1,
+                    total + visit.latency,
+                )
+        return latencies
+
+
+class LocalRunner:
+    def __init__(self, template, aws, api_call_latency=0.0, max_transitions=1000):
+        self.aws = aws
+        self.api_call_latency = api_call_latency
+        self.max_transitions = max_transitions
+        self.functions = load_functions(template, aws)
+
+        self.state_machines = {}
+        for logical_id, resource in template["Resources"].items():
+            if resource["Type"] == "AWS::StepFunctions::StateMachine":
+                properties = resource["Properties"]
+                self.state_machines[f"local:{logical_id}"] = (
+                    properties.get("StateMachineName", logical_id),
+                    properties.get("StateMachineType", "STANDARD"),
+                    json.loads(resolve(properties["DefinitionString"])),
+                )
+
+    def function(self, name):
+        for function in self.functions.values():
+            if function.name == name:
+                return function
+        raise KeyError(name)
+
+    # Invoke a Lambda function and run every execution it starts, directly or not
+    def trigger(self, scenario_name, function_name, event):
+        trigger = Execution(function_name, "LAMBDA", start=0.0)
+        pending = collections.deque()
+        calls_before = collections.Counter(self.aws.calls)
+        messages_before = len(self.aws.messages)
+        try:
+            result, latency = self.invoke(
+                trigger, self.function(function_name), event, 0.0, pending
+            )
+            trigger.status = "SUCCEEDED"
+            trigger.output = result
+        except StateFailed as e:
+            trigger.status, trigger.error = "FAILED", e
+            result, latency = None, 0.0
+        api_calls = self.api_calls_since(calls_before)
+        latency += self.api_call_latency * sum(api_calls.values())
+        trigger.visits.append(
+            StateVisit(
+                function_name,
+                "Lambda",
+                0.0,
+                latency,
+                api_calls,
+                len(json.dumps(result)),
+            )
+        )
+        trigger.end = latency
+
+        executions = [trigger]
+        while pending:
+            arn, execution_input, parent, start = pending.popleft()
+            executions.append(
+                self.run_execution(arn, execution_input, parent, start, pending)
+            )
+        return ScenarioResult(
+            scenario_name,
+            executions,
+            self.aws,
+            self.api_calls_since(calls_before),
+            self.aws.messages[messages_before:],
+        )
+
+    def run_execution(self, arn, execution_input, parent, start, pending):
+        name, state_machine_type, definition = self.state_machines[arn]
+        execution = Execution(name, state_machine_type, start, parent)
+        context = {
+            "Execution": {"Id": f"{arn}:execution:{start}", "Input": execution_input}
+        }
+
+        now = start
+        data = execution_input
+        state_name = definition["StartAt"]
+        try:
+            for _ in range(self.max_transitions):
+                state = definition["States"][state_name]
+                data, state_name = self.run_state(
+                    execution, state_name, state, data, context, now, pending
+                )
+                now += execution.visits[-1].latency
+                if state_name is None:
+                    break
+            else:
+                raise StateFailed("States.Runtime", "Maximum number of transitions")
+            execution.status = "SUCCEEDED"
+            execution.output = data
+        except StateFailed as e:
+            execution.status, execution.error = "FAILED", e
+        execution.end = now
+        return execution
+
+    def run_state(self, execution, state_name, state, data, context, now, pending):
+        calls_before = collections.Counter(self.aws.calls)
+        state_type = state["Type"]
+        state_input = get_path(data, state.get("InputPath", "$"))
+        latency = 0.0
+        next_state = state.get("Next")
+        caught = False
+
+        if state_type == "Pass":
+            result = state.get("Result", state_input)
+            data = set_path(state_input, state.get("ResultPath", "$"), result)
+        elif state_type == "Wait":
+            if "Seconds" in state:
+                latency = float(state["Seconds"])
+            elif "SecondsPath" in state:
+                latency = float(get_path(state_input, state["SecondsPath"]))
+            else:
+                raise NotImplementedError(f"Unsupported wait state: {state_name}")
+            data = state_input
+        elif state_type == "Choice":
+            next_state = next(
+                (c["Next"] for c in state["Choices"] if matches(c, state_input)),
+                state.get("Default"),
+            )
+            if next_state is None:
+                raise StateFailed("States.NoChoiceMatched", state_name)
+            data = state_input
+        elif state_type == "Succeed":
+            data = state_input
+        elif state_type == "Fail":
+            raise StateFailed(state.get("Error", "States.Fail"), state.get("Cause"))
+        elif state_type == "Task":
+            parameters = render_parameters(
+                state.get("Parameters", {}), state_input, context
+            )
+            try:
+                result, latency = self.run_task(
+                    execution, state, parameters, now, pending
+                )
+            except StateFailed as e:
+                catcher = next(
+                    (
+                        c
+                        for c in state.get("Catch", [])
+                        if e.error in c["ErrorEquals"]
+                        or "States.ALL" in c["ErrorEquals"]
+                    ),
+                    None,
+                )
+                if catcher is None:
+                    raise
+                error_output = {"Error": e.error, "Cause": e.cause}
+                data = set_path(
+                    state_input, catcher.get("ResultPath", "$"), error_output
+                )
+                next_state = catcher["Next"]
+                caught = True
+            else:
+                if state.get("ResultPath", "$") is not None:
+                    data = set_path(state_input, state.get("ResultPath", "$"), result)
+                else:
+                    data = state_input
+        else:
+            raise NotImplementedError(f"Unsupported state type: {state_type}")
+
+        if "OutputPath" in state and not caught:
+            data = get_path(data, state["OutputPath"])
+
+        api_calls = self.api_calls_since(calls_before)
+        latency += self.api_call_latency * sum(api_calls.values())
+        execution.visits.append(
+            StateVisit(
+                state_name,
+                state_type,
+                now,
+                latency,
+                api_calls,
+                len(json.dumps(data)),
+            )
+        )
+        if not caught and (state.get("End") or state_type in ("Succeed", "Fail")):
+            next_state = None
+        return data, next_state
+
+    def run_task(self, execution, state, parameters, now, pending):
+        resource = state["Resource"]
+        if resource.endswith(LAMBDA_INVOKE):
+            self.aws.calls["lambda:Invoke"] += 1
+            function = self.functions[parameters["FunctionName"]]
+            # The payload goes through JSON like it does between real states
+            payload = json.loads(json.dumps(parameters.get("Payload", {})))
+            payload, latency = self.invoke(execution, function, payload, now, pending)
+            result = {
+                "ExecutedVersion": "$LATEST",
+                "Payload": payload,
+                "StatusCode": 200,
+            }
+            return result, latency
+        if resource.endswith(START_EXECUTION):
+            self.aws.calls["states:StartExecution"] += 1
+            arn = parameters["StateMachineArn"]
+            name = parameters.get("Name")
+            if name and (arn, name) in self.aws.execution_names:
+                raise StateFailed(
+                    "StepFunctions.ExecutionAlreadyExistsException",
+                    f"Execution already exists: {name}",
+                )
+            if name:
+                self.aws.execution_names.add((arn, name))
+            parent = (execution, len(execution.visits))
+            pending.append((arn, parameters.get("Input", {}), parent, now))
+            return {"ExecutionArn": f"{arn}:execution", "StartDate": now}, 0.0
+        raise NotImplementedError(f"Unsupported task resource: {resource}")
+
+    # Invoke a handler, returns its result and the wall clock time it took
+    def invoke(self, execution, function, event, now, pending):
+        started_before = len(self.aws.started_executions)
+        started = time.perf_counter()
+        try:
+            result = json.loads(json.dumps(function.invoke(event)))
+        except Exception as e:
+            raise StateFailed(type(e).__name__, str(e))
+        latency = time.perf_counter() - started
+
+        # Executions started by the handler begin once it returns
+        parent = (execution, len(execution.visits))
+        for arn, execution_input in self.aws.started_executions[started_before:]:
+            pending.append((arn, execution_input, parent, now + latency))
+        return result, latency
+
+    def api_calls_since(self, calls_before):
+        api_calls = collections.Counter(self.aws.calls)
+        api_calls.subtract(calls_before)
+        return +api_calls
+
+
+def build_dataset(date, ids=3, prediction_error=5.0):
+    day = datetime.strptime(date, "%Y-%m-%d")
+    hist = ["id,timestamp,actual_power"]
+    pred = ["id,timestamp,p50"]
+    for panel_id in range(1, ids + 1):
+        for step in range(96):
+            timestamp = day + timedelta(minutes=15 * step)
+            actual_power = 350.0 * max(0.0, 1 - abs(step - 48) / 24)
+            hist.append(f"{panel_id},{timestamp},{actual_power}")
+            pred.append(f"{panel_id},{timestamp},{actual_power + prediction_error}")
+    return "\n".join(hist) + "\n", "\n".join(pred) + "\n"
+
+
+def compress(body, compression):
+    if compression == "gzip":
+        return gzip.compress(body.encode("utf-8")), ".gz"
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(body.encode("utf-8")), ".zst"
+    return body.encode("utf-8"), ""
+
+
+# prediction_error is compared with the rmse threshold of 50 stored in SSM
+SCENARIOS = {
+    "keep-model": {"prediction_error": 5.0},
+    "retrain-then-notify": {"prediction_error": 120.0},
+}
+
+
+# Upload the data of a scenario, returns the S3 event that starts the workflow
+def put_scenario_data(
+    aws,
+    name,
+    compression=None,
+    date="2024-06-01",
+    bucket_name="solar-power-forecast-local",
+    content_encoding=None,
+):
+
+    hist, pred = build_dataset(date, **SCENARIOS[name])
+    hist, suffix = compress(hist, compression)
+    pred, _ = compress(pred, compression)
+    # With a Content-Encoding the compression isn't visible in the key
+    if content_encoding:
+        suffix = ""
+    hist_key = f"data/hist/{date}/solar_power_data.csv{suffix}"
+    aws.put_object(bucket_name, hist_key, hist, content_encoding=content_encoding)
+    aws.put_object(
+        bucket_name,
+        hist_key.replace("hist", "pred"),
+        pred,
+        content_encoding=content_encoding,
+    )
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": bucket_name}, "object": {"key": hist_key}}}
+        ]
+    }
+
+
+# Run a scenario, then replay the same S3 event the given number of times
+def run_scenario(
+    name,
+    template=None,
+    compression=None,
+    automl_polls=2,
+    api_call_latency=0.0,
+    replays=0,
+):
+    template = template or synthesize_template()
+    aws = LocalAws(parameters={"rmse": "50"}, automl_polls=automl_polls)
+    s3_event = put_scenario_data(aws, name, compression=compression)
+
+    runner = LocalRunner(template, aws, api_call_latency=api_call_latency)
+    results = [runner.trigger(name, "execute_sfn", s3_event)]
+    for replay in range(1, replays + 1):
+        results.append(
+            runner.trigger(f"{name} replay {replay}", "execute_sfn", s3_event)
+        )
+    return results
+
+
+def format_report(result):
+    lines = [f"Scenario {result.name}: {result.status} in {result.duration:.3f}s"]
+
+    lines.append("  Critical path:")
+    for execution, visit in result.critical_path():
+        state = f"{execution.name} / {visit.name}"
+        lines.append(f"    {visit.start:>10.3f}s  {state:<58} {visit.latency:>10.3f}s")
+
+    lines.append("  Latency per state:")
+    for (execution_name, state_name), (
+        count,
+        total,
+    ) in result.state_latencies().items():
+        state = f"{execution_name} / {state_name}"
+        lines.append(f"    {state:<58} x{count:<3} {total:>10.3f}s")
+
+    lines.append(f"  AWS API calls ({sum(result.api_calls.values())}):")
+    for call, count in sorted(result.api_calls.items()):
+        lines.append(f"    {call:<58} {count:>4}")
+
+    largest = max(v.payload_bytes for e in result.executions for v in e.visits)
+    lines.append(f"  Largest state payload: {largest} bytes")
+    for execution in result.executions:
+        if execution.error:
+            lines.append(f"  {execution.name} failed: {execution.error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario", choices=sorted(SCENARIOS), action="append", dest="scenarios"
+    )
+    parser.add_argument(
+        "--template",
+        help="synthesized template, e.g. cdk.out/ResourceStack.template.json",
+    )
+    parser.add_argument("--compression", choices=["gzip", "zstd"])
+    parser.add_argument("--automl-polls", type=int, default=2)
+    parser.add_argument(
+        "--replays",
+        type=int,
+        default=0,
+        help="number of times the S3 event of a scenario is sent again",
+    )
+    parser.add_argument(
+        "--api-call-latency",
+        type=float,
+        default=0.0,
+        help="seconds added to a state for every AWS API call it makes",
+    )
+    args = parser.parse_args(argv)
+
+    template = None
+    if args.template:
+        with open(args.template) as f:
+            template = json.load(f)
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        for result in run_scenario(
+            name,
+            template=template,
+            compression=args.compression,
+            automl_polls=args.automl_polls,
+            api_call_latency=args.api_call_latency,
+            replays=args.replays,
+        ):
+            results.append(result)
+            print(format_report(result))
+    return 0 if all(r.status == "SUCCEEDED" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
 from aws_cdk import (
     Duration,
     RemovalPolicy,
+    Size,
     Stack,
     aws_dynamodb as dynamodb,
     aws_ec2 as ec2,
     aws_iam as iam,
     aws_lambda as lambda_,
+    aws_logs as logs,
     aws_s3 as s3,
     aws_s3_notifications as s3n,
     aws_sagemaker as sagemaker,
@@ -35,6 +37,18 @@ class ResourceStack(Stack):
             "Bucket",
             bucket_name=f"solar-power-forecast-{self.account}-{self.region}",
             removal_policy=RemovalPolicy.DESTROY,  # Consider using RETAIN for production
+            lifecycle_rules=[
+                # Large state fields offloaded between Step Functions states
+                s3.LifecycleRule(prefix="claim-check/", expiration=Duration.days(7)),
+                # Evaluation results cached by the versions of the input objects
+                s3.LifecycleRule(
+                    prefix="cache/evaluation/", expiration=Duration.days(30)
+                ),
+                # zstd training data recompressed to gzip for Autopilot
+                s3.LifecycleRule(
+                    prefix="autopilot/train_input/", expiration=Duration.days(30)
+                ),
+            ],
         )
 
         # Create SSM parameter for storing threshold
@@ -73,6 +87,26 @@ class ResourceStack(Stack):
         )
         lambda_role.add_to_policy(additional_policy_statement)
 
+        # Lambda layer with the helpers shared by all state handlers
+        # Bundling installs requirements.txt (zstandard) next to the helpers
+        shared_layer = lambda_.LayerVersion(
+            self,
+            "shared_layer",
+            code=lambda_.Code.from_asset(
+                "lambda_functions/shared",
+                bundling=core.BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_10.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "pip install -r requirements.txt -t /asset-output/python"
+                        " && cp -au python/. /asset-output/python",
+                    ],
+                ),
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_10],
+        )
+
         # Lambda function to evaluate the yesterday prediction result
         perform_evaluation = lambda_.Function(
             self,
@@ -82,6 +116,7 @@ class ResourceStack(Stack):
             code=lambda_.Code.from_asset(
                 "lambda_functions/perform_evaluation",
             ),
+            layers=[shared_layer],
             role=lambda_role,
             timeout=Duration.minutes(3),
         )
@@ -108,7 +143,12 @@ class ResourceStack(Stack):
             code=lambda_.Code.from_asset(
                 "lambda_functions/start_retrain",
             ),
+            layers=[shared_layer],
             role=lambda_role,
+            # Room to recompress zstd training data to gzip through /tmp
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            ephemeral_storage_size=Size.gibibytes(10),
             environment={
                 "SM_ROLE": sm_role.role_arn
             },  # Pass SageMaker role ARN as environment variable
@@ -121,6 +161,7 @@ class ResourceStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_10,
             handler="app.handler",
             code=lambda_.Code.from_asset("lambda_functions/check_status"),
+            layers=[shared_layer],
             role=lambda_role,
         )
 
@@ -131,6 +172,7 @@ class ResourceStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_10,
             handler="app.handler",
             code=lambda_.Code.from_asset("lambda_functions/get_best_model"),
+            layers=[shared_layer],
             role=lambda_role,
             environment={
                 "SM_ROLE": sm_role.role_arn
@@ -153,6 +195,7 @@ class ResourceStack(Stack):
             environment={
                 "SNS_TOPIC_ARN": sns_topic.topic_arn
             },  # Pass SNS topic ARN as environment variable
+            layers=[shared_layer],
             role=lambda_role,
         )
 
@@ -173,14 +216,7 @@ class ResourceStack(Stack):
             },
         )
 
-        # Define Step Functions State Machine
-        perform_evaluation_step = tasks.LambdaInvoke(
-            self,
-            "Evaluate Model Performance",
-            lambda_function=perform_evaluation,
-            output_path="$.Payload",
-        )
-
+        # Define the Standard State Machine for the long running retraining branch
         start_retrain_step = tasks.LambdaInvoke(
             self,
             "No, Start New AutoML Job",
@@ -188,16 +224,6 @@ class ResourceStack(Stack):
             output_path="$.Payload",
         )
 
-        # Choice state to determine whether to start AutopilotV2 for new model or not
-        retrain_choice_state = sfn.Choice(self, "Is Evaluation Passed?")
-
-        # If evaluation passed, keep the current model, otherwise start a new AutopilotV2 job
-        success_step = sfn.Pass(self, "Yes, Keep Current Model")
-        retrain_choice_state.when(
-            sfn.Condition.string_equals("$.eval_result", "YES"), success_step
-        )
-        retrain_choice_state.otherwise(start_retrain_step)
-
         # Wait for 5 minutes
         wait_state = sfn.Wait(
             self, "Wait 5 Minutes", time=sfn.WaitTime.duration(Duration.minutes(5))
@@ -240,15 +266,83 @@ class ResourceStack(Stack):
         )
 
         get_best_model_step.next(send_notification_step)
-        success_step.next(send_notification_step)
+
+        retraining_state_machine = sfn.StateMachine(
+            self,
+            "RetrainingStateMachine",
+            definition=start_retrain_step,
+            state_machine_name="Retraining",
+            state_machine_type=sfn.StateMachineType.STANDARD,
+        )
+
+        # Define the Express State Machine for the daily evaluation and notification
+        perform_evaluation_step = tasks.LambdaInvoke(
+            self,
+            "Evaluate Model Performance",
+            lambda_function=perform_evaluation,
+            output_path="$.Payload",
+        )
+
+        # Hand the retraining over to the Standard State Machine without waiting for it
+        # Express executions are at-least-once, the execution name built from the
+        # date and the evaluated versions of the inputs makes Step Functions reject
+        # a duplicate retraining, while new data under the same keys retrains again
+        start_retraining_step = tasks.StepFunctionsStartExecution(
+            self,
+            "No, Start Retraining Workflow",
+            state_machine=retraining_state_machine,
+            integration_pattern=sfn.IntegrationPattern.REQUEST_RESPONSE,
+            name=sfn.JsonPath.format(
+                "retrain-{}-{}",
+                sfn.JsonPath.string_at("$.date"),
+                sfn.JsonPath.hash(sfn.JsonPath.string_at("$.evaluation_key"), "MD5"),
+            ),
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        start_retraining_step.add_catch(
+            sfn.Succeed(self, "Retraining Already Started"),
+            errors=["StepFunctions.ExecutionAlreadyExistsException"],
+        )
+
+        # Choice state to determine whether to start AutopilotV2 for new model or not
+        retrain_choice_state = sfn.Choice(self, "Is Evaluation Passed?")
+
+        # If evaluation passed, keep the current model, otherwise start retraining
+        success_step = sfn.Pass(self, "Yes, Keep Current Model")
+        retrain_choice_state.when(
+            sfn.Condition.string_equals("$.eval_result", "YES"), success_step
+        )
+        retrain_choice_state.otherwise(start_retraining_step)
+
+        send_report_step = tasks.LambdaInvoke(
+            self,
+            "Send Daily Report",
+            lambda_function=send_notification,
+            output_path="$.Payload",
+        )
+
+        success_step.next(send_report_step)
 
         definition = perform_evaluation_step.next(retrain_choice_state)
 
+        # Express executions are only visible in CloudWatch Logs
+        evaluation_log_group = logs.LogGroup(
+            self,
+            "EvaluationStateMachineLogs",
+            retention=logs.RetentionDays.ONE_MONTH,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
         state_machine = sfn.StateMachine(
             self,
             "StateMachine",
             definition=definition,
-            state_machine_name="Evaluation-Retraining",
+            state_machine_name="Evaluation",
+            state_machine_type=sfn.StateMachineType.EXPRESS,
+            timeout=Duration.minutes(5),
+            logs=sfn.LogOptions(
+                destination=evaluation_log_group, level=sfn.LogLevel.ALL
+            ),
         )
 
         # Lambda function to execute Step Function by S3 event
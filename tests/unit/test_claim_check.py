@@ -0,0 +1,111 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+from sagemaker_autopilot_time_series_monitoring_retraining.local_runner import (
+    SHARED_DIR,
+    LocalAws,
+)
+
+BUCKET = "solar-power-forecast-local"
+
+
+@pytest.fixture
+def aws():
+    return LocalAws()
+
+
+# Import the helper of the Lambda layer with boto3 replaced by the S3 stand-in
+@pytest.fixture
+def claim_check(aws, monkeypatch):
+    boto3 = types.ModuleType("boto3")
+    boto3.client = aws.client
+    monkeypatch.setitem(sys.modules, "boto3", boto3)
+    monkeypatch.syspath_prepend(str(SHARED_DIR))
+    monkeypatch.delitem(sys.modules, "claim_check", raising=False)
+    module = importlib.import_module("claim_check")
+    monkeypatch.setattr(module, "threshold_bytes", 100)
+    yield module
+    sys.modules.pop("claim_check", None)
+
+
+def large_value():
+    return {str(i): i * 1.5 for i in range(50)}
+
+
+def test_large_field_is_replaced_by_reference(aws, claim_check):
+    output = claim_check.offload(
+        {"bucket_name": BUCKET, "date": "2024-06-01", "rmse_by_id": large_value()}
+    )
+
+    assert claim_check.is_reference(output["rmse_by_id"])
+    assert output["date"] == "2024-06-01"
+    assert output["bucket_name"] == BUCKET
+    assert aws.calls["s3:PutObject"] == 1
+    key = output["rmse_by_id"]["claim_check"]["key"]
+    assert (BUCKET, key) in aws.objects
+
+
+def test_reference_is_fetched_when_field_is_read(aws, claim_check):
+    output = claim_check.offload({"bucket_name": BUCKET, "rmse_by_id": large_value()})
+    event = claim_check.LazyEvent(output)
+
+    assert event.get("bucket_name") == BUCKET
+    assert aws.calls["s3:GetObject"] == 0
+    event["rmse_by_id"]
+    event.get("rmse_by_id")
+    assert aws.calls["s3:GetObject"] == 1
+
+
+def test_untouched_reference_passes_through(aws, claim_check):
+    output = claim_check.offload({"bucket_name": BUCKET, "rmse_by_id": large_value()})
+    calls = aws.calls.copy()
+
+    @claim_check.offload_large_fields
+    def handler(event, context):
+        event["eval_result"] = "YES"
+        return event
+
+    result = handler(output, None)
+
+    assert result["rmse_by_id"] == output["rmse_by_id"]
+    assert result["eval_result"] == "YES"
+    assert aws.calls == calls
+
+
+def test_field_round_trips_through_s3(aws, claim_check):
+    value = large_value()
+    output = claim_check.offload({"bucket_name": BUCKET, "rmse_by_id": value})
+
+    @claim_check.offload_large_fields
+    def handler(event, context):
+        return event["rmse_by_id"]
+
+    assert handler(output, None) == value
+
+
+def test_read_field_keeps_its_reference(aws, claim_check):
+    output = claim_check.offload({"bucket_name": BUCKET, "rmse_by_id": large_value()})
+
+    @claim_check.offload_large_fields
+    def read(event, context):
+        event["rmse_by_id"]
+        return event
+
+    @claim_check.offload_large_fields
+    def update(event, context):
+        event["rmse_by_id"]["1"] = 0.0
+        return event
+
+    # Reading the field doesn't upload it again
+    result = read(output, None)
+    assert result["rmse_by_id"] == output["rmse_by_id"]
+    assert aws.calls["s3:PutObject"] == 1
+
+    # Changing it does
+    result = update(output, None)
+    assert claim_check.is_reference(result["rmse_by_id"])
+    assert result["rmse_by_id"] != output["rmse_by_id"]
+    assert aws.calls["s3:PutObject"] == 2
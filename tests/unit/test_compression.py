@@ -0,0 +1,73 @@
+import gzip
+import importlib
+import io
+import sys
+
+import pytest
+import zstandard
+from botocore.response import StreamingBody
+
+from sagemaker_autopilot_time_series_monitoring_retraining.local_runner import (
+    SHARED_DIR,
+)
+
+CSV = "id,timestamp,actual_power\n1,2024-06-01 12:00:00,350.0\n"
+
+
+# Import the helper of the Lambda layer
+@pytest.fixture
+def compression(monkeypatch):
+    monkeypatch.syspath_prepend(str(SHARED_DIR))
+    monkeypatch.delitem(sys.modules, "compression", raising=False)
+    yield importlib.import_module("compression")
+    sys.modules.pop("compression", None)
+
+
+def streaming_body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+@pytest.mark.parametrize(
+    "key, content_encoding, expected",
+    [
+        ("data.csv", None, None),
+        ("data.csv.gz", None, "gzip"),
+        ("DATA.CSV.ZST", None, "zstd"),
+        ("data.csv", "gzip", "gzip"),
+        ("data.csv", "x-gzip", "gzip"),
+        ("data.csv", " ZSTD ", "zstd"),
+        # The Content-Encoding takes precedence over the key suffix
+        ("data.csv.gz", "zstd", "zstd"),
+        # An unknown encoding falls back to the key suffix
+        ("data.csv.zst", "br", "zstd"),
+        ("data.csv", "identity", None),
+    ],
+)
+def test_detect_compression(compression, key, content_encoding, expected):
+    assert compression.detect_compression(key, content_encoding) == expected
+
+
+def test_open_text_plain(compression):
+    body = streaming_body(CSV.encode("utf-8"))
+
+    with compression.open_text(body, None) as content:
+        assert content.read() == CSV
+
+
+def test_open_text_gzip(compression):
+    body = streaming_body(gzip.compress(CSV.encode("utf-8")))
+
+    with compression.open_text(body, compression.GZIP) as content:
+        assert list(content) == CSV.splitlines(keepends=True)
+
+
+def test_open_text_reads_every_zstd_frame(compression):
+    header, rows = CSV.splitlines(keepends=True)
+    compressor = zstandard.ZstdCompressor()
+    data = compressor.compress(header.encode("utf-8")) + compressor.compress(
+        rows.encode("utf-8")
+    )
+    body = streaming_body(data)
+
+    with compression.open_text(body, compression.ZSTD) as content:
+        assert content.read() == CSV
@@ -0,0 +1,191 @@
+import pytest
+
+from sagemaker_autopilot_time_series_monitoring_retraining.local_runner import (
+    LocalAws,
+    LocalS3,
+    build_dataset,
+    LocalRunner,
+    put_scenario_data,
+    run_scenario,
+    synthesize_template,
+)
+
+
+@pytest.fixture(scope="module")
+def template():
+    return synthesize_template()
+
+
+def critical_path(result):
+    return [(e.name, v.name) for e, v in result.critical_path()]
+
+
+def test_keep_model_scenario(template):
+    (result,) = run_scenario("keep-model", template=template)
+
+    assert result.status == "SUCCEEDED"
+    assert critical_path(result) == [
+        ("execute_sfn", "execute_sfn"),
+        ("Evaluation", "Evaluate Model Performance"),
+        ("Evaluation", "Is Evaluation Passed?"),
+        ("Evaluation", "Yes, Keep Current Model"),
+        ("Evaluation", "Send Daily Report"),
+    ]
+    assert [e.name for e in result.executions] == ["execute_sfn", "Evaluation"]
+    assert result.api_calls["sns:Publish"] == 1
+    assert not any(call.startswith("sagemaker:") for call in result.api_calls)
+    assert "perform well" in result.messages[0]["Message"]
+
+
+def test_retrain_then_notify_scenario(template):
+    (result,) = run_scenario("retrain-then-notify", template=template, automl_polls=2)
+
+    assert result.status == "SUCCEEDED"
+    assert [e.name for e in result.executions] == [
+        "execute_sfn",
+        "Evaluation",
+        "Retraining",
+    ]
+    path = critical_path(result)
+    assert path[3] == ("Evaluation", "No, Start Retraining Workflow")
+    assert path[-1] == ("Retraining", "Send Email for Model Review")
+
+    # Three waits of 5 minutes on the virtual clock, two polls plus the last one
+    assert path.count(("Retraining", "Wait 5 Minutes")) == 3
+    assert result.duration >= 900
+    assert result.state_latencies()[("Retraining", "Check AutoML Status")][0] == 3
+    assert result.api_calls["sagemaker:CreateAutoMLJobV2"] == 1
+    assert result.api_calls["sagemaker:DescribeAutoMLJobV2"] == 4
+    assert result.api_calls["states:StartExecution"] == 2
+    assert "Model is retrained" in result.messages[0]["Message"]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_inputs(template, compression):
+    (result,) = run_scenario(
+        "retrain-then-notify", template=template, compression=compression
+    )
+
+    assert result.status == "SUCCEEDED"
+    (job,) = result.aws.automl_jobs.values()
+    (channel,) = job["request"]["AutoMLJobInputDataConfig"]
+    # Autopilot reads gzip as is, zstd is recompressed to gzip first
+    assert channel["CompressionType"] == "Gzip"
+    assert channel["DataSource"]["S3DataSource"]["S3Uri"].endswith(".csv.gz")
+    recompressed = [k for _, k in result.aws.objects if k.startswith("autopilot/")]
+    assert len(recompressed) == (1 if compression == "zstd" else 0)
+
+
+def test_content_encoding_of_plain_csv_key(template):
+    aws = LocalAws(parameters={"rmse": "50"})
+    s3_event = put_scenario_data(
+        aws, "retrain-then-notify", compression="gzip", content_encoding="gzip"
+    )
+    result = LocalRunner(template, aws).trigger("gzip", "execute_sfn", s3_event)
+
+    assert result.status == "SUCCEEDED"
+    (job,) = aws.automl_jobs.values()
+    (channel,) = job["request"]["AutoMLJobInputDataConfig"]
+    # The object is read and trained on as gzip, although its key ends in .csv
+    assert channel["CompressionType"] == "Gzip"
+    assert channel["DataSource"]["S3DataSource"]["S3Uri"].endswith(".csv")
+    assert not any(k.startswith("autopilot/") for _, k in aws.objects)
+
+
+def test_replay_reuses_cached_evaluation(template):
+    result, replay = run_scenario("keep-model", template=template, replays=1)
+
+    assert result.api_calls["s3:GetObject"] == 3
+    assert result.api_calls["s3:PutObject"] == 1
+    # Only the ETags of the inputs are checked, the data isn't downloaded again
+    assert replay.status == "SUCCEEDED"
+    assert replay.api_calls["s3:HeadObject"] == 2
+    assert replay.api_calls["s3:GetObject"] == 0
+    assert replay.api_calls["s3:PutObject"] == 0
+    assert replay.executions[1].output == result.executions[1].output
+
+
+def test_duplicate_evaluation_does_not_retrain_again(template):
+    result, replay = run_scenario("retrain-then-notify", template=template, replays=1)
+
+    assert [e.name for e in result.executions][-1] == "Retraining"
+    assert replay.status == "SUCCEEDED"
+    assert [e.name for e in replay.executions] == ["execute_sfn", "Evaluation"]
+    assert critical_path(replay)[-1] == ("Evaluation", "Retraining Already Started")
+    assert not any(call.startswith("sagemaker:") for call in replay.api_calls)
+    assert replay.messages == []
+
+
+def test_changed_input_retrains_again(template):
+    aws = LocalAws(parameters={"rmse": "50"})
+    runner = LocalRunner(template, aws)
+    s3_event = put_scenario_data(aws, "retrain-then-notify")
+    result = runner.trigger("retrain", "execute_sfn", s3_event)
+
+    # New and worse predictions under the same keys, then the same S3 event
+    hist, pred = build_dataset("2024-06-01", prediction_error=240.0)
+    for key, body in [("hist", hist), ("pred", pred)]:
+        key = f"data/{key}/2024-06-01/solar_power_data.csv"
+        aws.put_object("solar-power-forecast-local", key, body)
+    changed = runner.trigger("changed", "execute_sfn", s3_event)
+    replay = runner.trigger("replay", "execute_sfn", s3_event)
+
+    assert [e.name for e in result.executions][-1] == "Retraining"
+    assert [e.name for e in changed.executions][-1] == "Retraining"
+    assert changed.api_calls["sagemaker:CreateAutoMLJobV2"] == 1
+    assert "Model is retrained" in changed.messages[0]["Message"]
+    # Only a duplicate of the same versions is rejected
+    assert critical_path(replay)[-1] == ("Evaluation", "Retraining Already Started")
+
+
+def test_cached_evaluation_survives_cold_start(template):
+    aws = LocalAws(parameters={"rmse": "50"})
+    s3_event = put_scenario_data(aws, "keep-model")
+    LocalRunner(template, aws).trigger("keep-model", "execute_sfn", s3_event)
+
+    # A new runner imports the handlers again, with an empty memory cache
+    replay = LocalRunner(template, aws).trigger("replay", "execute_sfn", s3_event)
+
+    assert replay.api_calls["s3:GetObject"] == 1
+    assert replay.api_calls["s3:PutObject"] == 0
+
+
+def test_changed_input_invalidates_cached_evaluation(template):
+    aws = LocalAws(parameters={"rmse": "50"})
+    runner = LocalRunner(template, aws)
+    s3_event = put_scenario_data(aws, "keep-model")
+    result = runner.trigger("keep-model", "execute_sfn", s3_event)
+
+    # Same keys, new content and so new ETags
+    put_scenario_data(aws, "retrain-then-notify")
+    replay = runner.trigger("retrain-then-notify", "execute_sfn", s3_event)
+
+    assert result.executions[1].output["eval_result"] == "YES"
+    assert replay.executions[1].output["eval_result"] == "NO"
+    assert replay.api_calls["s3:GetObject"] == 3
+    assert [e.name for e in replay.executions][-1] == "Retraining"
+
+
+def test_input_overwritten_while_read_is_evaluated_again(template, monkeypatch):
+    aws = LocalAws(parameters={"rmse": "50"})
+    runner = LocalRunner(template, aws)
+    s3_event = put_scenario_data(aws, "retrain-then-notify")
+
+    # The inputs are replaced right after their ETags are first read
+    head_object = LocalS3.head_object
+
+    def overwrite_after_head(self, Bucket, Key, **kwargs):
+        response = head_object(self, Bucket, Key, **kwargs)
+        if aws.calls["s3:HeadObject"] == 2:
+            put_scenario_data(aws, "keep-model")
+        return response
+
+    monkeypatch.setattr(LocalS3, "head_object", overwrite_after_head)
+    result = runner.trigger("retrain-then-notify", "execute_sfn", s3_event)
+
+    assert result.status == "SUCCEEDED"
+    assert result.api_calls["s3:HeadObject"] == 4
+    # The result is the one of the new inputs, cached under their ETags
+    assert result.executions[1].output["eval_result"] == "YES"
+    assert result.api_calls["s3:PutObject"] == 1
+    assert [e.name for e in result.executions][-1] == "Evaluation"
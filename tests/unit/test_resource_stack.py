@@ -0,0 +1,152 @@
+import json
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from sagemaker_autopilot_time_series_monitoring_retraining.resource_stack import (
+    ResourceStack,
+)
+
+
+@pytest.fixture(scope="module")
+def template():
+    # Skip the Docker bundling of the Lambda layer
+    app = core.App(
+        context={
+            "email": "data-scientist@example.com",
+            "aws:cdk:bundling-stacks": [],
+        }
+    )
+    stack = ResourceStack(app, "ResourceStack")
+    return assertions.Template.from_stack(stack)
+
+
+# Render the Fn::Join of a state machine definition, replacing tokens by placeholders
+def state_machine_definition(template, state_machine_name):
+    state_machines = template.find_resources(
+        "AWS::StepFunctions::StateMachine",
+        {"Properties": {"StateMachineName": state_machine_name}},
+    )
+    assert len(state_machines) == 1
+    (state_machine,) = state_machines.values()
+    _, parts = state_machine["Properties"]["DefinitionString"]["Fn::Join"]
+    return json.loads(
+        "".join(part if isinstance(part, str) else "TOKEN" for part in parts)
+    )
+
+
+def test_evaluation_is_express_state_machine(template):
+    template.has_resource_properties(
+        "AWS::StepFunctions::StateMachine",
+        {"StateMachineName": "Evaluation", "StateMachineType": "EXPRESS"},
+    )
+
+
+def test_retraining_is_standard_state_machine(template):
+    template.has_resource_properties(
+        "AWS::StepFunctions::StateMachine",
+        {"StateMachineName": "Retraining", "StateMachineType": "STANDARD"},
+    )
+
+
+def test_evaluation_definition(template):
+    definition = state_machine_definition(template, "Evaluation")
+    states = definition["States"]
+
+    assert definition["StartAt"] == "Evaluate Model Performance"
+    assert definition["TimeoutSeconds"] == 300
+    assert states["Is Evaluation Passed?"]["Choices"] == [
+        {
+            "Variable": "$.eval_result",
+            "StringEquals": "YES",
+            "Next": "Yes, Keep Current Model",
+        }
+    ]
+    assert states["Is Evaluation Passed?"]["Default"] == "No, Start Retraining Workflow"
+    assert states["Yes, Keep Current Model"]["Next"] == "Send Daily Report"
+    assert states["Send Daily Report"]["End"] is True
+
+    # Retraining is started without waiting for it, Express workflows can't wait
+    start_retraining = states["No, Start Retraining Workflow"]
+    assert start_retraining["Resource"].endswith(":states:::states:startExecution")
+    assert start_retraining["ResultPath"] is None
+    assert start_retraining["End"] is True
+
+    # Express executions are at-least-once, a duplicate can't start a second retraining
+    assert (
+        start_retraining["Parameters"]["Name.$"]
+        == "States.Format('retrain-{}-{}', $.date, States.Hash($.evaluation_key, 'MD5'))"
+    )
+    assert start_retraining["Catch"] == [
+        {
+            "ErrorEquals": ["StepFunctions.ExecutionAlreadyExistsException"],
+            "Next": "Retraining Already Started",
+        }
+    ]
+    assert states["Retraining Already Started"] == {"Type": "Succeed"}
+
+    # The long running AutoML loop stays out of the Express workflow
+    assert "Wait 5 Minutes" not in states
+    assert "Check AutoML Status" not in states
+
+
+def test_retraining_definition(template):
+    definition = state_machine_definition(template, "Retraining")
+    states = definition["States"]
+
+    assert definition["StartAt"] == "No, Start New AutoML Job"
+    assert states["No, Start New AutoML Job"]["Next"] == "Wait 5 Minutes"
+    assert states["Wait 5 Minutes"] == {
+        "Type": "Wait",
+        "Seconds": 300,
+        "Next": "Check AutoML Status",
+    }
+    assert states["Is AutoML Complete?"]["Default"] == "Wait 5 Minutes"
+    assert (
+        states["AutoML Completed. Get the Best Model"]["Next"]
+        == "Send Email for Model Review"
+    )
+    assert states["Send Email for Model Review"]["End"] is True
+    assert "Evaluate Model Performance" not in states
+
+
+def test_s3_event_starts_evaluation(template):
+    state_machines = template.find_resources(
+        "AWS::StepFunctions::StateMachine",
+        {"Properties": {"StateMachineName": "Evaluation"}},
+    )
+    (logical_id,) = state_machines
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": {"STATE_MACHINE_ARN": {"Ref": logical_id}}}},
+    )
+
+
+def test_start_retrain_can_recompress_training_data(template):
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {"Variables": {"SM_ROLE": assertions.Match.any_value()}},
+            "Handler": "app.handler",
+            "Timeout": 900,
+            "MemorySize": 1024,
+            "EphemeralStorage": {"Size": 10240},
+        },
+    )
+    template.has_resource_properties(
+        "AWS::S3::Bucket",
+        {
+            "LifecycleConfiguration": {
+                "Rules": assertions.Match.array_with(
+                    [
+                        {
+                            "Prefix": "autopilot/train_input/",
+                            "ExpirationInDays": 30,
+                            "Status": "Enabled",
+                        }
+                    ]
+                )
+            }
+        },
+    )